@@ -1,5 +1,7 @@
 import random
 
+import profiler
+
 # 定義した S-Box とその逆写像
 S_BOX = {
     0x0: 0xF, 0x1: 0xE, 0x2: 0xB, 0x3: 0xC,
@@ -26,6 +28,9 @@ def encrypt_cipherA(m: int, key: int) -> int:
          c = v ⊕ k1
       出力: 4ビット暗号文 c
     """
+    if profiler.ENABLED:
+        profiler.count("encryptions")
+        profiler.count("sbox_lookups")
     k0 = (key >> 4) & 0xF
     k1 = key & 0xF
     u = m ^ k0
@@ -53,21 +58,25 @@ def linear_attack(pairs: list[tuple[int,int]]) -> tuple[int,list[int],list[int]]
     """
     N = len(pairs)
     T = [0, 0]
-    for m, c in pairs:
-        # 左辺 = (α·m) ⊕ (β·c) ⊕ 1
-        lhs = (parity(ALPHA, m) ^ parity(BETA, c) ^ 1)
-        T[lhs] += 1
+    with profiler.stage("parity"):
+        for m, c in pairs:
+            # 左辺 = (α·m) ⊕ (β·c) ⊕ 1
+            lhs = (parity(ALPHA, m) ^ parity(BETA, c) ^ 1)
+            T[lhs] += 1
+    profiler.count("pairs_processed", N)
 
     # T[0] > T[1] なら s=0, そうでなければ s=1
     s = 0 if T[0] > T[1] else 1
 
     # s を満たす鍵を全探索で絞り込む
     candidates = []
-    for key in range(2**8-1):
-        k0 = (key >> 4) & 0xF
-        k1 = key & 0xF
-        if (parity(ALPHA, k0) ^ parity(BETA, k1)) == s:
-            candidates.append(key)
+    with profiler.stage("scoring"):
+        for key in range(2**8-1):
+            k0 = (key >> 4) & 0xF
+            k1 = key & 0xF
+            if (parity(ALPHA, k0) ^ parity(BETA, k1)) == s:
+                candidates.append(key)
+    profiler.count("candidates_scored", 2**8-1)
 
     return s, T, candidates
 
@@ -76,6 +85,8 @@ if __name__ == "__main__":
     # 線形マスク
     ALPHA = 0b1001  # (1,0,0,1)
     BETA  = 0b0010  # (0,0,1,0)
+    # True にするとデータ生成・攻撃の各ステージの計測結果を表示
+    PROFILE = False
     # ランダム鍵の生成
     true_key = random.randint(0, 255)
     #true_key = 0xF3
@@ -85,12 +96,13 @@ if __name__ == "__main__":
     # plaintexts = [random.randint(0, 15) for _ in range(N)]
     # pairs = [(m, encrypt_block(m, true_key)) for m in plaintexts]
     # 0から15までの16通りの平文を生成し、暗号文とのペアを作成
-    plaintexts = list(range(16))
-    pairs = [(m, encrypt_cipherA(m, true_key)) for m in plaintexts]
-
+    with profiler.profiling(enabled=PROFILE) as prof:
+        with profiler.stage("data_generation"):
+            plaintexts = list(range(16))
+            pairs = [(m, encrypt_cipherA(m, true_key)) for m in plaintexts]
 
-    # 線形攻撃を実行
-    s, T, candidates = linear_attack(pairs)
+        # 線形攻撃を実行
+        s, T, candidates = linear_attack(pairs)
 
     print(f"True key: 0x{true_key:02X}")
     print(f"Estimated s: {s}")
@@ -108,3 +120,7 @@ if __name__ == "__main__":
         print(f"Recovered key: 0x{recovered:02X}")
     else:
         print("Key not found in candidates.")
+
+    if PROFILE:
+        print()
+        print(prof.report())
@@ -1,5 +1,8 @@
 import random
 
+import profiler
+from candidate_stats import CandidateStats
+
 
 # --- S-box, parity 関数　---
 SBOX = {
@@ -32,6 +35,9 @@ def encrypt_cipherC(m, keys):
          c = z ⊕ k3
       出力: 4ビット暗号文 c
     """
+    if profiler.ENABLED:
+        profiler.count("encryptions")
+        profiler.count("sbox_lookups", 3)
     k0, k1, k2, k3 = keys
     u = m ^ k0
     v = S(u)
@@ -71,34 +77,47 @@ def linear_attack(plaintexts, ciphertexts):
     カウント値の偏り（ε）と目標バイアスとの差(diff)も計算する
     """
 
-    stats = {} # 各k3候補に対する統計 (count0, count1)
+    # 各k3候補に対する統計 (count0, count1)。ε と diff は参照時にまとめて計算される
+    stats = CandidateStats.for_bits(4, target_epsilon)
 
     # k3 の全候補 (0x0 から 0xF) を試す
     for key_candidate in range(16):
-        count0 = 0
-        count1 = 0
-        # 各平文・暗号文ペアで近似式が成り立つかカウント
-        for m, c in zip(plaintexts, ciphertexts):
-            # k3候補を使って、y' を計算
-            z_prime = c ^ key_candidate
-            y_prime = S_inv(z_prime)
-            
-            # 線形近似式 parity(m, d) ^ parity(w', d) ^ 1 を計算(εがーだから)
-            # この値は、正しいk2の場合、ある未知の鍵ビットのパリティと高い確率で一致するはず
-            val = parity(m, MASKD) ^ parity(y_prime, MASKD) ^ 1
-            # val が 0 か 1 かをカウント
-            if val == 0:
-                count0 += 1
-            else:
-                count1 += 1
-        total = count0 + count1
-        major   = max(count0, count1)
-        epsilon = major / total - 0.5       # 観測バイアス
-        diff    = abs(epsilon - target_epsilon)
-
-        stats[key_candidate] = (count0,count1,epsilon,diff)
-
-    return stats
+        if profiler.ENABLED:
+            # 計測時のみ、部分復号とパリティ計算を 2 パスに分けて別々に計測する
+            # (中間リストを作るので、無効時は下の 1 パスのループを使う)
+            with profiler.stage("partial_decryption"):
+                y_primes = [S_inv(c ^ key_candidate) for c in ciphertexts]
+            with profiler.stage("parity"):
+                count1 = sum(parity(m, MASKD) ^ parity(y_prime, MASKD) ^ 1
+                             for m, y_prime in zip(plaintexts, y_primes))
+            count0 = len(y_primes) - count1
+        else:
+            count0 = 0
+            count1 = 0
+            # 各平文・暗号文ペアで近似式が成り立つかカウント
+            for m, c in zip(plaintexts, ciphertexts):
+                # k3候補を使って、y' を計算
+                z_prime = c ^ key_candidate
+                y_prime = S_inv(z_prime)
+
+                # 線形近似式 parity(m, d) ^ parity(y', d) ^ 1 を計算(εがーだから)
+                # この値は、正しいk3の場合、ある未知の鍵ビットのパリティと高い確率で一致するはず
+                val = parity(m, MASKD) ^ parity(y_prime, MASKD) ^ 1
+                # val が 0 か 1 かをカウント
+                if val == 0:
+                    count0 += 1
+                else:
+                    count1 += 1
+
+        stats.set_counts(key_candidate, count0, count1)
+
+        if profiler.ENABLED:
+            profiler.count("pair_evaluations", count0 + count1)
+            profiler.count("sbox_lookups", count0 + count1)
+            profiler.count("candidates_scored")
+
+    # ε と diff はここでまとめて計算する (計測時は "scoring" ステージになる)
+    return stats.score()
 
 
 # --- 実行コード ---
@@ -119,17 +138,23 @@ secret_key =(                   #秘密鍵を分割
 
 # N 個の既知平文・暗号文ペアを生成する
 N = 2000  # 必要なペア数は偏りの大きさに依存
-plaintexts = []
-ciphertexts = []
-for _ in range(N):
-    m = random.randint(0, 15)
-    # m = _
-    c = encrypt_cipherC(m, secret_key)
-    plaintexts.append(m)
-    ciphertexts.append(c)
-
-# 線形攻撃の実行
-stats = linear_attack(plaintexts, ciphertexts)
+# True にするとデータ生成・攻撃の各ステージの計測結果を表示
+PROFILE = False
+
+with profiler.profiling(enabled=PROFILE) as prof:
+    with profiler.stage("data_generation"):
+        plaintexts = []
+        ciphertexts = []
+        for _ in range(N):
+            m = random.randint(0, 15)
+            # m = _
+            c = encrypt_cipherC(m, secret_key)
+            plaintexts.append(m)
+            ciphertexts.append(c)
+
+    # 線形攻撃の実行
+    stats = linear_attack(plaintexts, ciphertexts)
+
 for key_candidate, (count0,count1,epsilon,diff) in stats.items():
     print(f"{key_candidate=}, cnt0={count0}, cnt1={count1}, ε={epsilon:.5f}, diff={diff:.5f}")
 
@@ -138,4 +163,8 @@ print(f"Target epsilon: {target_epsilon:.5f}")
 # 正しい (k0 ⊕ k1 ⊕ k2) ⋅ d の値を計算して比較
 true_key_xor = secret_key[0] ^ secret_key[1] ^ secret_key[2]
 true_bit     = parity(true_key_xor, MASKD)
-print("Correct bit (k0 ⊕ k1 ⊕ k2) ⋅ d:", true_bit)
\ No newline at end of file
+print("Correct bit (k0 ⊕ k1 ⊕ k2) ⋅ d:", true_bit)
+
+if PROFILE:
+    print()
+    print(prof.report())
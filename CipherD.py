@@ -1,5 +1,10 @@
 import random
 
+import numpy as np
+
+import profiler
+from candidate_stats import CandidateStats
+
 # --- S-box, P-box, parity関数　---
 #S-box
 SBOX = {
@@ -100,6 +105,9 @@ def encrypt_cipherD(m, keys):
         # Final Key Addition
         c = x4 ^ k4
     """
+    if profiler.ENABLED:
+        profiler.count("encryptions")
+        profiler.count("sbox_lookups", 16)
     k0, k1, k2, k3, k4 = keys
 
     # Round 1
@@ -159,113 +167,231 @@ def linear_attack_cipherD(plaintexts, ciphertexts, MASK_P, MASK_U4, target_epsil
     カウント値の偏り（ε）と目標バイアスとの差(diff)も計算する
     """
 
-    stats = {} # 各k4候補(上位4bit)に対する統計 (count0, count1)
+    # 各k4候補(上位4bit)に対する統計 (count0, count1)。ε と diff は参照時にまとめて計算される
+    stats = CandidateStats.for_bits(4, target_epsilon)
 
     # k4 の上位4ビット候補 (0x0 から 0xF) を試す
     for key_candidate_prefix in range(16):
         # 候補となるk4を構築 (下位12ビットは0と仮定)
         key_candidate = key_candidate_prefix << 12
 
-        count0 = 0
-        count1 = 0
-        # 各平文・暗号文ペアで近似式が成り立つかカウント
-        for m, c in zip(plaintexts, ciphertexts):
-            # k4候補を使って、u4' を計算
-            x4_prime = c ^ key_candidate
-            u4_prime = S_layer_inv(x4_prime) # 最終ラウンドのS-box層の入力を復元
+        if profiler.ENABLED:
+            # 計測時のみ、部分復号とパリティ計算を 2 パスに分けて別々に計測する
+            # (中間リストを作るので、無効時は下の 1 パスのループを使う)
+            with profiler.stage("partial_decryption"):
+                u4_primes = [S_layer_inv(c ^ key_candidate) for c in ciphertexts]
+            with profiler.stage("parity"):
+                count1 = sum(parity(m, MASK_P) ^ parity(u4_prime, MASK_U4)
+                             for m, u4_prime in zip(plaintexts, u4_primes))
+            count0 = len(u4_primes) - count1
+        else:
+            count0 = 0
+            count1 = 0
+            # 各平文・暗号文ペアで近似式が成り立つかカウント
+            for m, c in zip(plaintexts, ciphertexts):
+                # k4候補を使って、u4' を計算
+                x4_prime = c ^ key_candidate
+                u4_prime = S_layer_inv(x4_prime) # 最終ラウンドのS-box層の入力を復元
+
+                # 線形近似式 parity(m, MASK_P) ^ parity(u4', MASK_U4) を計算
+                # この値は、正しいk4の場合、ある定数または鍵ビットと高い確率で一致するはず
+                # ここでは CIPHER C の例に倣い、値が 0 か 1 かをカウントする
+                # (注: 実際の攻撃では、定数項や鍵ビット項を考慮する必要がある場合がある)
+                # (注: CIPHER Cの例では ^1 があったが、これはεが負の場合。ここでは仮定しない)
+                val = parity(m, MASK_P) ^ parity(u4_prime, MASK_U4)
+
+                # val が 0 か 1 かをカウント
+                if val == 0:
+                    count0 += 1
+                else:
+                    count1 += 1
+
+        if profiler.ENABLED:
+            profiler.count("pair_evaluations", count0 + count1)
+            profiler.count("sbox_lookups", 4 * (count0 + count1))
+            profiler.count("candidates_scored")
+
+        # total == 0 の候補は stats から除外される (ゼロ除算回避)
+        stats.set_counts(key_candidate_prefix, count0, count1)
+
+    # ε と diff はここでまとめて計算する (計測時は "scoring" ステージになる)
+    return stats.score()
+
+
+# --- 両端 (第1ラウンド・最終ラウンド) の鍵推定 ---
+# 平文側でも k0 の 1 ニブルを推測して v1 = S_layer(m ^ k0) の 1 ニブルを復元すると、
+# 近似式 parity(v1, MASK_V1) ^ parity(u4, MASK_U4) は 1 ラウンド短くなりバイアスが大きくなる。
+# MASK_V1, MASK_U4 がそれぞれ 1 ニブルに収まっていれば、必要なのは
+# 平文・暗号文の該当ニブルだけなので、データを 16×16 のカウンタ表に圧縮してから
+# (k0, k4) の 2^8 通りの推測をその表だけで評価できる。
+
+def _active_nibble(mask):
+    """mask が 1 つのニブルに収まっていればその位置 (0 が最下位) を返す"""
+    positions = [i for i in range(4) if (mask >> (4 * i)) & 0xF]
+    if len(positions) != 1:
+        raise ValueError(f"mask {mask:#06x} must be confined to a single nibble")
+    return positions[0]
+
+
+def distill_counters_cipherD(plaintexts, ciphertexts, MASK_V1, MASK_U4):
+    """
+    平文の MASK_V1 側ニブル p と暗号文の MASK_U4 側ニブル c の組の出現回数
+    T[p, c] (16×16 = 2^8 要素) を数える。
+    別々に数えた表は足し合わせるだけで合算できる。
+    """
+    pos_p = _active_nibble(MASK_V1)
+    pos_c = _active_nibble(MASK_U4)
+    with profiler.stage("distillation"):
+        p = (np.asarray(plaintexts, dtype=np.int64) >> (4 * pos_p)) & 0xF
+        c = (np.asarray(ciphertexts, dtype=np.int64) >> (4 * pos_c)) & 0xF
+        counters = np.bincount(p * 16 + c, minlength=256).reshape(16, 16)
+    profiler.count("pairs_processed", len(p))
+    return counters
 
-            # 線形近似式 parity(m, MASK_P) ^ parity(u4', MASK_U4) を計算
-            # この値は、正しいk4の場合、ある定数または鍵ビットと高い確率で一致するはず
-            # ここでは CIPHER C の例に倣い、値が 0 か 1 かをカウントする
-            # (注: 実際の攻撃では、定数項や鍵ビット項を考慮する必要がある場合がある)
-            # (注: CIPHER Cの例では ^1 があったが、これはεが負の場合。ここでは仮定しない)
-            val = parity(m, MASK_P) ^ parity(u4_prime, MASK_U4)
 
-            # val が 0 か 1 かをカウント
-            if val == 0:
-                count0 += 1
-            else:
-                count1 += 1
+def score_counters_cipherD(counters, MASK_V1, MASK_U4, target_epsilon):
+    """
+    カウンタ表 T[p, c] から (k0, k4) の該当ニブルの全 2^8 通りの推測を評価する。
+    候補は (k0 のニブル << 4) | k4 のニブル。計算量は N に依存しない。
+    (注: S-box とマスクによっては k0 側の 2 つの推測が同じ |ε| になり区別できない。
+     例えば MASK_V1 = 0x0300 では parity(S(x), 3) ^ parity(S(x ^ 0xD), 3) が定数なので、
+     g0 と g0 ^ 0xD は常に同じ |ε| になり、k0[11:8] は 3 ビット分しか決まらない)
+    """
+    mask_v = (MASK_V1 >> (4 * _active_nibble(MASK_V1))) & 0xF
+    mask_u = (MASK_U4 >> (4 * _active_nibble(MASK_U4))) & 0xF
 
-        total = count0 + count1
-        if total == 0: continue # ゼロ除算回避
-        major   = max(count0, count1)
-        epsilon = major / total - 0.5       # 観測バイアス
-        diff    = abs(epsilon - target_epsilon) # 目標バイアスとの差
+    with profiler.stage("lookup_tables"):
+        # A[g0, p] = parity(S(p ^ g0), mask_v),  B[g4, c] = parity(S_inv(c ^ g4), mask_u)
+        A = np.array([[parity(S(p ^ g0), mask_v) for p in range(16)] for g0 in range(16)], dtype=np.int64)
+        B = np.array([[parity(S_inv(c ^ g4), mask_u) for c in range(16)] for g4 in range(16)], dtype=np.int64)
 
-        stats[key_candidate_prefix] = (count0, count1, epsilon, diff)
+    with profiler.stage("counter_products"):
+        # count1[g0, g4] = Σ_{p,c} T[p, c] · (A[g0, p] ⊕ B[g4, c])
+        T = np.asarray(counters, dtype=np.int64)
+        count1 = A @ T @ (1 - B).T + (1 - A) @ T @ B.T
+        count0 = T.sum() - count1
 
-    return stats
+    if profiler.ENABLED:
+        profiler.count("sbox_lookups", 2 * 16 * 16)
+        profiler.count("candidates_scored", 256)
+
+    return CandidateStats.from_counts(count0, count1, target_epsilon).score()
+
+
+def linear_attack_cipherD_two_ended(plaintexts, ciphertexts, MASK_V1, MASK_U4, target_epsilon):
+    """
+    CipherD に対する両端の線形攻撃 (k0 と k4 の 1 ニブルずつを同時に推定)。
+    v1マスク MASK_V1, u4マスク MASK_U4 (いずれも 1 ニブル内) を使用。
+    """
+    counters = distill_counters_cipherD(plaintexts, ciphertexts, MASK_V1, MASK_U4)
+    return score_counters_cipherD(counters, MASK_V1, MASK_U4, target_epsilon)
 
 
 # --- 実行コード ---
 
-# 近似式に使用するマスク (例: 最上位ビット。適切なマスクは別途線形特性解析で求める必要がある)
-# CIPHER C の MASKD に相当
-MASK_P = 0x8000 # 平文マスク (例)
-MASK_U4 = 0x8000 # 最終ラウンドS-box入力マスク (例)
-
-# 目標とするバイアス (ε)
-# (注: これは仮の値。実際の値はCipherDの線形特性に依存する)
-# CIPHER D の元コードの計算結果 0.015625 を参考に設定 (絶対値)
-# target_epsilon = 0.015625
-# CIPHER C の例に合わせて設定
-target_epsilon = abs(1/2 - 3/8) # CIPHER C Sbox のバイアス例 (ここでは仮)
-
-# 乱数で秘密鍵を設定（各鍵は 16 ビット）
-# 鍵タプル keys = (k0, k1, k2, k3, k4)
-secret_key = tuple(random.randint(0, 2**16 - 1) for _ in range(5))
-
-# 元のコードの鍵を使用する場合 (コメントアウト解除)
-# secret_key = (0x5b92, 0x064b, 0x1e03, 0xa55f, 0xecbd)
-
-# N 個の既知平文・暗号文ペアを生成する
-N = 10000 # 必要なペア数は偏りの大きさに依存 (16ビットブロックなので最大2^16個の異なる平文)
-plaintexts = []
-ciphertexts = []
-# 既知平文をランダムに生成 (重複を許容)
-for _ in range(N):
-    m = random.randint(0, 2**16 - 1)
-    c = encrypt_cipherD(m, secret_key)
-    plaintexts.append(m)
-    ciphertexts.append(c)
-
-# (オプション) 全ての平文を使用する場合 (N=2**16)
-# N = 2**16
-# plaintexts = list(range(N))
-# ciphertexts = [encrypt_cipherD(m, secret_key) for m in plaintexts]
-
-
-# 線形攻撃の実行 (k4の上位4ビットを推定)
-stats = linear_attack_cipherD(plaintexts, ciphertexts, MASK_P, MASK_U4, target_epsilon)
-
-print(f"--- Linear Attack on CipherD (Estimating k4[15:12]) ---")
-print(f"Using {N} plaintext/ciphertext pairs.")
-print(f"Plaintext Mask: {hex(MASK_P)}, U4 Mask: {hex(MASK_U4)}")
-print(f"Target epsilon: {target_epsilon:.5f}\n")
-
-# 結果をバイアスの差 (diff) が小さい順にソートして表示
-sorted_stats = sorted(stats.items(), key=lambda item: item[1][3])
-
-print("Key Candidate (k4[15:12]), Count0, Count1, Observed Epsilon, Diff from Target")
-for key_candidate_prefix, (count0, count1, epsilon, diff) in sorted_stats:
-    print(f"           {key_candidate_prefix:#0{3}x}           , {count0:6d}, {count1:6d}, {epsilon: .5f},        {diff:.5f}")
-
-print("\nSecret keys (k0, k1, k2, k3, k4):")
-print(f"k0: {secret_key[0]:#06x}")
-print(f"k1: {secret_key[1]:#06x}")
-print(f"k2: {secret_key[2]:#06x}")
-print(f"k3: {secret_key[3]:#06x}")
-print(f"k4: {secret_key[4]:#06x}")
-
-correct_k4_prefix = (secret_key[4] >> 12) & 0xF
-print(f"\nCorrect k4 prefix (k4[15:12]): {correct_k4_prefix:#0{3}x}")
-
-# 最も可能性の高い鍵候補を表示
-most_likely_key_prefix = sorted_stats[0][0]
-print(f"Most likely k4 prefix found by attack: {most_likely_key_prefix:#0{3}x}")
-
-if most_likely_key_prefix == correct_k4_prefix:
-    print("Attack successful: Correct k4 prefix identified.")
-else:
-    print("Attack failed: Correct k4 prefix not identified (may need more data, better masks, or different target epsilon).")
\ No newline at end of file
+if __name__ == "__main__":
+    # 近似式に使用するマスク (例: 最上位ビット。適切なマスクは別途線形特性解析で求める必要がある)
+    # CIPHER C の MASKD に相当
+    MASK_P = 0x8000 # 平文マスク (例)
+    MASK_U4 = 0x8000 # 最終ラウンドS-box入力マスク (例)
+
+    # 目標とするバイアス (ε)
+    # (注: これは仮の値。実際の値はCipherDの線形特性に依存する)
+    # CIPHER D の元コードの計算結果 0.015625 を参考に設定 (絶対値)
+    # target_epsilon = 0.015625
+    # CIPHER C の例に合わせて設定
+    target_epsilon = abs(1/2 - 3/8) # CIPHER C Sbox のバイアス例 (ここでは仮)
+
+    # 両端攻撃用のマスク (v1 の k0[11:8] 側ニブル → u4 の k4[7:4] 側ニブル)
+    # 全 2^16 個の v1 について数えると、|ε| は鍵 k1, k2, k3 に応じて 1/8, 3/16, 5/16 のいずれか。
+    # 目標を最大値 5/16 にして、|ε| の大きい候補ほど上位になるようにする
+    MASK_V1 = 0x0300
+    MASK_U4_TWO_ENDED = 0x0020
+    target_epsilon_two_ended = 5/16
+
+    # 乱数で秘密鍵を設定（各鍵は 16 ビット）
+    # 鍵タプル keys = (k0, k1, k2, k3, k4)
+    secret_key = tuple(random.randint(0, 2**16 - 1) for _ in range(5))
+
+    # 元のコードの鍵を使用する場合 (コメントアウト解除)
+    # secret_key = (0x5b92, 0x064b, 0x1e03, 0xa55f, 0xecbd)
+
+    # N 個の既知平文・暗号文ペアを生成する
+    N = 10000 # 必要なペア数は偏りの大きさに依存 (16ビットブロックなので最大2^16個の異なる平文)
+    # True にするとデータ生成・攻撃の各ステージの計測結果を表示
+    PROFILE = False
+
+    with profiler.profiling(enabled=PROFILE) as prof:
+        with profiler.stage("data_generation"):
+            plaintexts = []
+            ciphertexts = []
+            # 既知平文をランダムに生成 (重複を許容)
+            for _ in range(N):
+                m = random.randint(0, 2**16 - 1)
+                c = encrypt_cipherD(m, secret_key)
+                plaintexts.append(m)
+                ciphertexts.append(c)
+
+        # (オプション) 全ての平文を使用する場合 (N=2**16)
+        # N = 2**16
+        # plaintexts = list(range(N))
+        # ciphertexts = [encrypt_cipherD(m, secret_key) for m in plaintexts]
+
+
+        # 線形攻撃の実行 (k4の上位4ビットを推定)
+        stats = linear_attack_cipherD(plaintexts, ciphertexts, MASK_P, MASK_U4, target_epsilon)
+
+        # 両端攻撃の実行 (k0[11:8] と k4[7:4] を同時に推定)
+        stats_two_ended = linear_attack_cipherD_two_ended(
+            plaintexts, ciphertexts, MASK_V1, MASK_U4_TWO_ENDED, target_epsilon_two_ended)
+
+    print(f"--- Linear Attack on CipherD (Estimating k4[15:12]) ---")
+    print(f"Using {N} plaintext/ciphertext pairs.")
+    print(f"Plaintext Mask: {hex(MASK_P)}, U4 Mask: {hex(MASK_U4)}")
+    print(f"Target epsilon: {target_epsilon:.5f}\n")
+
+    # 結果をバイアスの差 (diff) が小さい順にソートして表示
+    ranked = stats.top_k(len(stats))
+
+    print("Key Candidate (k4[15:12]), Count0, Count1, Observed Epsilon, Diff from Target")
+    for key_candidate_prefix in ranked:
+        count0, count1, epsilon, diff = stats[key_candidate_prefix]
+        print(f"           {key_candidate_prefix:#0{3}x}           , {count0:6d}, {count1:6d}, {epsilon: .5f},        {diff:.5f}")
+
+    print("\nSecret keys (k0, k1, k2, k3, k4):")
+    print(f"k0: {secret_key[0]:#06x}")
+    print(f"k1: {secret_key[1]:#06x}")
+    print(f"k2: {secret_key[2]:#06x}")
+    print(f"k3: {secret_key[3]:#06x}")
+    print(f"k4: {secret_key[4]:#06x}")
+
+    correct_k4_prefix = (secret_key[4] >> 12) & 0xF
+    print(f"\nCorrect k4 prefix (k4[15:12]): {correct_k4_prefix:#0{3}x} (rank {stats.rank_of(correct_k4_prefix)})")
+
+    # 最も可能性の高い鍵候補を表示
+    most_likely_key_prefix = int(ranked[0])
+    print(f"Most likely k4 prefix found by attack: {most_likely_key_prefix:#0{3}x}")
+
+    if most_likely_key_prefix == correct_k4_prefix:
+        print("Attack successful: Correct k4 prefix identified.")
+    else:
+        print("Attack failed: Correct k4 prefix not identified (may need more data, better masks, or different target epsilon).")
+
+    print(f"\n--- Two-ended Linear Attack on CipherD (Estimating k0[11:8], k4[7:4]) ---")
+    print(f"V1 Mask: {hex(MASK_V1)}, U4 Mask: {hex(MASK_U4_TWO_ENDED)}")
+    print(f"Target epsilon: {target_epsilon_two_ended:.5f}\n")
+
+    print("k0[11:8], k4[7:4], Count0, Count1, Observed Epsilon, Diff from Target")
+    for key_candidate in stats_two_ended.top_k(5):
+        count0, count1, epsilon, diff = stats_two_ended[key_candidate]
+        print(f"   {key_candidate >> 4:#0{3}x}  ,   {key_candidate & 0xF:#0{3}x}  , {count0:6d}, {count1:6d}, {epsilon: .5f},        {diff:.5f}")
+
+    # k0[11:8] は g0 と g0 ^ 0xD が同じ |ε| になるので、同じ diff の候補は同順位として数える
+    correct_pair = (((secret_key[0] >> 8) & 0xF) << 4) | ((secret_key[4] >> 4) & 0xF)
+    print(f"\nCorrect (k0[11:8], k4[7:4]): ({correct_pair >> 4:#0{3}x}, {correct_pair & 0xF:#0{3}x})"
+          f" (rank {stats_two_ended.rank_of(correct_pair, break_ties=False)} of {len(stats_two_ended)},"
+          f" tied with {stats_two_ended.ties_of(correct_pair) - 1} other candidate(s))")
+
+    if PROFILE:
+        print()
+        print(prof.report())
@@ -1,3 +1,5 @@
+import profiler
+
 # S-Box 定義
 S_BOX = {
     0x0: 0xF, 0x1: 0xE, 0x2: 0xB, 0x3: 0xC,
@@ -12,22 +14,31 @@ def bit_dot(mask: int, x: int) -> int:
     """
     return bin(mask & x).count("1") % 2
 
-def find_best_masks():
+def find_best_masks(sbox=S_BOX):
+    """
+    sbox (既定は S_BOX) のバイアス上位10件のマスク組み合わせを返す。
+    sbox_search.search_sboxes() で見つけた S-box も渡せる。
+    """
     results = []
     # α, β を 1～15 (非ゼロ 4ビット) の全組み合わせで試す
-    for alpha in range(1, 16):
-        for beta in range(1, 16):
-            match_count = 0
-            # S-Box の全入力 x について α·x == β·S[x] の回数をカウント
-            for x in range(16):
-                if bit_dot(alpha, x) == bit_dot(beta, S_BOX[x]):
-                    match_count += 1
-            p = match_count / 16.0
-            bias = abs(p - 0.5)
-            results.append((bias, alpha, beta, match_count, p))
+    with profiler.stage("lat_scan"):
+        for alpha in range(1, 16):
+            for beta in range(1, 16):
+                match_count = 0
+                # S-Box の全入力 x について α·x == β·S[x] の回数をカウント
+                for x in range(16):
+                    if bit_dot(alpha, x) == bit_dot(beta, sbox[x]):
+                        match_count += 1
+                p = match_count / 16.0
+                bias = abs(p - 0.5)
+                results.append((bias, alpha, beta, match_count, p))
+    if profiler.ENABLED:
+        profiler.count("sbox_lookups", 16 * len(results))
+        profiler.count("candidates_scored", len(results))
 
     # バイアスの大きい順 (= 情報量の多い順) にソート
-    results.sort(reverse=True, key=lambda t: t[0])
+    with profiler.stage("sort"):
+        results.sort(reverse=True, key=lambda t: t[0])
 
     # 上位10件を返す
     return results[:10]
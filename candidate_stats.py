@@ -0,0 +1,261 @@
+import numpy as np
+
+import profiler
+
+# --- 鍵候補ごとの統計 (count0, count1, epsilon, diff) ---
+# 候補数が 2^16～2^24 になっても扱えるよう、カウンタは構造化配列に整数で持ち、
+# epsilon / diff は必要になった時点でまとめて計算する。
+# 1 候補あたりのメモリ:
+#   カウンタ  8 B (count0 + count1 < 2^32 の間は uint32、超えたら uint64 に切り替え)
+#   diff      8 B (計算後のキャッシュ。epsilon はキャッシュしない)
+#   候補値    4 B (候補が 0..n-1 の連番でない場合のみ)
+
+MAX_UINT32 = 2**32 - 1
+
+
+def _counts_dtype(counter):
+    return np.dtype([("count0", counter), ("count1", counter)])
+
+
+class CandidateStats:
+    """
+    鍵候補ごとのパリティカウントと、観測バイアス ε・目標バイアスとの差 diff。
+      epsilon = max(count0, count1) / (count0 + count1) - 0.5
+      diff    = |epsilon - target_epsilon|
+    count0 + count1 == 0 の候補 (未集計) は辞書としてのアクセスから除外される。
+
+    stats[候補], 候補 in stats, get() は 1 候補あたり O(1)。
+    items(), keys(), values() は既存の呼び出し側のための互換用で、
+    全候補分の Python のリストを作るので小さい表 (2^4～2^8 程度) にだけ使う。
+    大きい表では top_k() と rank_of() を使う。
+    """
+
+    def __init__(self, candidates, target_epsilon):
+        candidates = np.sort(np.asarray(candidates, dtype=np.uint32))
+        if len(candidates) > 1 and np.any(candidates[1:] == candidates[:-1]):
+            raise ValueError("candidates must be unique")
+        self.target_epsilon = target_epsilon
+        self.data = np.zeros(len(candidates), dtype=_counts_dtype(np.uint32))
+        # 候補が 0..n-1 の連番なら候補値は持たず、添字をそのまま候補値として使う
+        if np.array_equal(candidates, np.arange(len(candidates))):
+            self.candidates = None
+        else:
+            self.candidates = candidates
+        self._diff = None
+
+    @classmethod
+    def for_bits(cls, bits, target_epsilon):
+        """0 から 2**bits - 1 までの全候補を持つ統計を作る"""
+        return cls(np.arange(2**bits, dtype=np.uint32), target_epsilon)
+
+    @classmethod
+    def from_counts(cls, count0, count1, target_epsilon):
+        """候補 0..n-1 のカウント配列 count0, count1 から統計を作る"""
+        count0 = np.ravel(count0)
+        count1 = np.ravel(count1)
+        stats = cls(np.arange(len(count0), dtype=np.uint32), target_epsilon)
+        if len(count0):
+            stats._reserve(int((count0.astype(np.uint64) + count1.astype(np.uint64)).max()))
+        stats.data["count0"] = count0
+        stats.data["count1"] = count1
+        return stats
+
+    @classmethod
+    def merged(cls, parts):
+        """
+        複数ワーカーが別々のデータで数えた統計を合算する。
+        候補集合と target_epsilon はすべて同じでなければならない。
+        """
+        parts = list(parts)
+        if not parts:
+            raise ValueError("no statistics to merge")
+        result = cls(parts[0]._candidate_values(np.arange(len(parts[0].data))),
+                     parts[0].target_epsilon)
+        for part in parts:
+            result.merge(part)
+        return result
+
+    # --- カウンタの更新 ---
+
+    def _candidate_values(self, idx):
+        """添字 idx に対応する候補値"""
+        if self.candidates is None:
+            return idx
+        return self.candidates[idx]
+
+    def _index(self, candidate):
+        if self.candidates is None:
+            if 0 <= candidate < len(self.data):
+                return candidate
+            raise KeyError(candidate)
+        i = int(np.searchsorted(self.candidates, candidate))
+        if i < len(self.candidates) and self.candidates[i] == candidate:
+            return i
+        raise KeyError(candidate)
+
+    def _reserve(self, max_total):
+        # count0 + count1 が uint32 に収まらなくなる場合だけカウンタを uint64 にする
+        if max_total > MAX_UINT32 and self.data.dtype["count0"] == np.uint32:
+            self.data = self.data.astype(_counts_dtype(np.uint64))
+
+    def _invalidate(self):
+        self._diff = None
+
+    def set_counts(self, candidate, count0, count1):
+        i = self._index(candidate)
+        self._reserve(count0 + count1)
+        self.data["count0"][i] = count0
+        self.data["count1"][i] = count1
+        self._invalidate()
+
+    def add_counts(self, candidate, count0, count1):
+        i = self._index(candidate)
+        self._reserve(self._total_at(i) + count0 + count1)
+        self.data["count0"][i] += count0
+        self.data["count1"][i] += count1
+        self._invalidate()
+
+    def merge(self, other):
+        """other のカウントをこの統計に足し込む"""
+        if self.target_epsilon != other.target_epsilon:
+            raise ValueError("target_epsilon differs")
+        if len(self.data) != len(other.data) or not (
+                (self.candidates is None and other.candidates is None)
+                or np.array_equal(self.candidates, other.candidates)):
+            raise ValueError("candidate sets differ")
+        if len(self.data):
+            self._reserve(int(self.total.max()) + int(other.total.max()))
+        self.data["count0"] += other.data["count0"]
+        self.data["count1"] += other.data["count1"]
+        self._invalidate()
+        return self
+
+    # --- 派生値 (遅延計算) ---
+
+    @property
+    def total(self):
+        # _reserve() により count0 + count1 はカウンタの型に収まる
+        return self.data["count0"] + self.data["count1"]
+
+    @property
+    def epsilon(self):
+        """全候補の ε (キャッシュしない)"""
+        total = self.total
+        major = np.maximum(self.data["count0"], self.data["count1"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return major / total - 0.5
+
+    @property
+    def diff(self):
+        if self._diff is None:
+            self._diff = np.abs(self.epsilon - self.target_epsilon)
+        return self._diff
+
+    def score(self):
+        """
+        diff を今すぐまとめて計算し self を返す。
+        攻撃関数の中で呼ぶと profiler の "scoring" ステージとして計測される。
+        """
+        with profiler.stage("scoring"):
+            self.diff  # 結果はキャッシュされる
+        return self
+
+    def _total_at(self, i):
+        # 1 候補分の合計。全体の total を作り直さない
+        return int(self.data["count0"][i]) + int(self.data["count1"][i])
+
+    def _epsilon_at(self, i):
+        count0 = int(self.data["count0"][i])
+        count1 = int(self.data["count1"][i])
+        return max(count0, count1) / (count0 + count1) - 0.5
+
+    def _scored(self):
+        """集計済み (total > 0) の候補の添字"""
+        return np.flatnonzero(self.total > 0)
+
+    # --- 順位付け ---
+
+    def top_k(self, k):
+        """
+        diff の小さい順に上位 k 個の候補値を返す (diff が同じなら候補値の小さい順)。
+        全体をソートせず argpartition で上位 k 個だけを取り出す。
+        """
+        idx = self._scored()
+        k = min(k, len(idx))
+        if k == 0:
+            return np.empty(0, dtype=np.uint32)
+        diff = self.diff[idx]
+        if k < len(idx):
+            part = np.argpartition(diff, k - 1)[:k]
+            # 境界と同じ diff を持つ候補も含めてから並べ直し、同順位を候補値順で決める
+            part = np.flatnonzero(diff <= diff[part].max())
+            idx, diff = idx[part], diff[part]
+        order = np.lexsort((self._candidate_values(idx), diff))[:k]
+        return np.asarray(self._candidate_values(idx[order]), dtype=np.uint32)
+
+    def rank_of(self, candidate, break_ties=True):
+        """
+        diff の小さい順に並べたときの candidate の順位 (1 始まり)。
+        break_ties=False なら diff が同じ候補は同順位とする
+        (diff が candidate より真に小さい候補の数 + 1)。
+        集計されていない候補なら len(self) + 1 を返す。
+        """
+        i = self._index(candidate)
+        if self._total_at(i) == 0:
+            return len(self) + 1
+        idx = self._scored()
+        diff = self.diff[idx]
+        better = diff < self.diff[i]
+        if break_ties:
+            better |= (diff == self.diff[i]) & (self._candidate_values(idx) < candidate)
+        return int(np.count_nonzero(better)) + 1
+
+    def ties_of(self, candidate):
+        """candidate と diff が同じ候補の数 (candidate 自身を含む)"""
+        i = self._index(candidate)
+        return int(np.count_nonzero(self.diff[self._scored()] == self.diff[i]))
+
+    # --- 辞書としてのアクセス ---
+
+    def __len__(self):
+        return int(np.count_nonzero(self.total > 0))
+
+    def __contains__(self, candidate):
+        try:
+            i = self._index(candidate)
+        except KeyError:
+            return False
+        return self._total_at(i) > 0
+
+    def __getitem__(self, candidate):
+        i = self._index(candidate)
+        if self._total_at(i) == 0:
+            raise KeyError(candidate)
+        return (int(self.data["count0"][i]), int(self.data["count1"][i]),
+                self._epsilon_at(i), float(self.diff[i]))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [int(c) for c in self._candidate_values(self._scored())]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def items(self):
+        idx = self._scored()
+        epsilon = self.epsilon[idx]
+        return list(zip(
+            (int(c) for c in self._candidate_values(idx)),
+            zip((int(c) for c in self.data["count0"][idx]),
+                (int(c) for c in self.data["count1"][idx]),
+                (float(e) for e in epsilon),
+                (float(d) for d in self.diff[idx])),
+        ))
+
+    def get(self, candidate, default=None):
+        try:
+            return self[candidate]
+        except KeyError:
+            return default
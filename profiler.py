@@ -0,0 +1,146 @@
+import cProfile
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# --- 攻撃・暗号化のホットパス計測 ---
+# 無効時 (ENABLED = False) は各フックが bool 判定 1 回だけで素通りする。
+# 実験 1 回分だけ計測したい場合は profiling() コンテキストマネージャで囲む。
+#
+#   with profiling(cprofile=True) as prof:
+#       stats = linear_attack_cipherD(...)
+#   print(prof.report())
+#   prof.to_json("stats.json")
+#   prof.dump_stats("attack.prof")   # pstats / snakeviz で読める形式
+#
+# ステージ名とカウンタ名は攻撃間で同じ意味で使う:
+#   data_generation     既知平文・暗号文ペアの生成
+#   partial_decryption  鍵候補ごとの最終ラウンド部分復号 (S_inv / S_layer_inv)
+#   parity              鍵候補ごとの近似式のパリティ計算と集計
+#   distillation        データを (平文ニブル, 暗号文ニブル) のカウンタ表に圧縮
+#   lookup_tables       カウンタ表を評価するための 16×16 パリティ表の作成
+#   counter_products    カウンタ表と 16×16 パリティ表の行列積
+#   scoring             ε と diff の計算
+#   pairs_processed     読み込んだペアの数 (1 回の攻撃で N)
+#   pair_evaluations    (鍵候補, ペア) の評価回数 (1 回の攻撃で 候補数 × N)
+# 1 パス攻撃の partial_decryption / parity は、計測が有効なときだけ
+# 2 パスに分けて実行される (無効時は 1 パスのループのまま)。
+
+ENABLED = False
+
+
+class Stats:
+    """
+    ステージ別タイマーとカウンタの集計結果。
+    timers は {ステージ名: [合計秒数, 呼び出し回数]}。
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.cprofile = None
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, elapsed):
+        entry = self.timers.setdefault(name, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+
+    def as_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "timers": {
+                name: {"seconds": total, "calls": calls}
+                for name, (total, calls) in self.timers.items()
+            },
+        }
+
+    def to_json(self, path=None):
+        """
+        集計結果を JSON 文字列で返す。path を指定した場合はファイルにも書き出す。
+        """
+        text = json.dumps(self.as_dict(), indent=2, ensure_ascii=False)
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def dump_stats(self, path):
+        """
+        cProfile の結果を pstats 形式で書き出す (profiling(cprofile=True) の場合のみ)。
+        """
+        if self.cprofile is None:
+            raise RuntimeError("cProfile is not enabled; use profiling(cprofile=True)")
+        self.cprofile.dump_stats(path)
+
+    def report(self):
+        """人が読むための簡易表示"""
+        lines = ["Stage                     Seconds     Calls"]
+        for name, (total, calls) in sorted(self.timers.items(), key=lambda t: -t[1][0]):
+            lines.append(f"{name:<22} {total:>10.4f} {calls:>9d}")
+        lines.append("")
+        lines.append("Counter                        Value")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<22} {value:>13d}")
+        return "\n".join(lines)
+
+
+_stats = Stats()
+_NULL = nullcontext()
+
+
+def current():
+    """現在集計中の Stats を返す"""
+    return _stats
+
+
+def count(name, n=1):
+    """カウンタ name を n 増やす (無効時は何もしない)"""
+    if ENABLED:
+        _stats.count(name, n)
+
+
+@contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stats.add_time(name, time.perf_counter() - start)
+
+
+def stage(name):
+    """
+    ステージ name の経過時間を計測するコンテキストマネージャを返す。
+    無効時は共有の nullcontext を返すので新しいオブジェクトは作られない。
+    """
+    if not ENABLED:
+        return _NULL
+    return _timed(name)
+
+
+@contextmanager
+def profiling(cprofile=False, enabled=True):
+    """
+    ブロック内だけ計測を有効にし、その間の Stats を返す。
+    enabled=False の場合は何も計測せず空の Stats を返す (スクリプト側の切り替え用)。
+    """
+    global ENABLED, _stats
+    stats = Stats()
+    if not enabled:
+        yield stats
+        return
+
+    prev_enabled, prev_stats = ENABLED, _stats
+    ENABLED, _stats = True, stats
+    if cprofile:
+        stats.cprofile = cProfile.Profile()
+        stats.cprofile.enable()
+    try:
+        yield stats
+    finally:
+        if cprofile:
+            stats.cprofile.disable()
+        ENABLED, _stats = prev_enabled, prev_stats
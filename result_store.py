@@ -0,0 +1,233 @@
+import random
+import sqlite3
+import time
+
+from CipherD import _active_nibble, encrypt_cipherD, linear_attack_cipherD
+
+# --- 実験結果ストア (SQLite) ---
+# 1 回の攻撃 (暗号, マスク, N, シード, 目標バイアス) を experiments の 1 行とし、
+# 各鍵候補の (count0, count1, epsilon, diff) を candidates に保存する。
+# 同じ設定は UNIQUE 制約で 1 回しか保存されないので、スイープを再実行しても
+# 未計算の設定だけが計算される。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id                INTEGER PRIMARY KEY,
+    cipher            TEXT    NOT NULL,
+    mask_p            INTEGER NOT NULL,
+    mask_u            INTEGER NOT NULL,
+    n                 INTEGER NOT NULL,
+    seed              INTEGER NOT NULL,
+    target_epsilon    REAL    NOT NULL,
+    key               TEXT    NOT NULL,   -- 鍵タプルを16進で ',' 区切り
+    correct_candidate INTEGER NOT NULL,
+    correct_rank      INTEGER NOT NULL,   -- diff が正解候補より真に小さい候補数 + 1 (同 diff は同順位)
+    correct_ties      INTEGER NOT NULL,   -- 正解候補と diff が同じ候補の数 (正解候補自身を含む)
+    time_generate     REAL    NOT NULL,   -- データ生成時間 [s]
+    time_attack       REAL    NOT NULL,   -- 攻撃時間 [s]
+    created_at        TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (cipher, mask_p, mask_u, n, seed, target_epsilon)
+);
+
+CREATE TABLE IF NOT EXISTS candidates (
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id) ON DELETE CASCADE,
+    candidate     INTEGER NOT NULL,
+    count0        INTEGER NOT NULL,
+    count1        INTEGER NOT NULL,
+    epsilon       REAL    NOT NULL,
+    diff          REAL    NOT NULL,
+    PRIMARY KEY (experiment_id, candidate)
+);
+"""
+
+CONFIG_COLUMNS = ("cipher", "mask_p", "mask_u", "n", "seed", "target_epsilon")
+
+
+class ResultStore:
+    """
+    実験結果を SQLite に保存・検索するクラス。
+    path に ":memory:" を指定するとメモリ上に作成する。
+    """
+
+    def __init__(self, path="results.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(experiments)")}
+        if "correct_ties" not in columns:
+            # 旧スキーマの correct_rank は同 diff を候補値順で並べた値なので流用できない
+            raise RuntimeError(f"{path} uses an older schema without correct_ties; "
+                               "delete it and re-run the sweep")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def completed_configs(self, cipher):
+        """保存済みの設定 (CONFIG_COLUMNS の順のタプル) の集合を返す"""
+        rows = self.conn.execute(
+            f"SELECT {', '.join(CONFIG_COLUMNS)} FROM experiments WHERE cipher = ?",
+            (cipher,),
+        )
+        return set(rows)
+
+    def add_many(self, records):
+        """
+        run_experiment_cipherD() の結果のリストを 1 トランザクションで保存する。
+        既に保存済みの設定は無視する。保存した件数を返す。
+        """
+        added = 0
+        with self.conn:
+            for rec in records:
+                cur = self.conn.execute(
+                    """
+                    INSERT OR IGNORE INTO experiments
+                        (cipher, mask_p, mask_u, n, seed, target_epsilon, key,
+                         correct_candidate, correct_rank, correct_ties,
+                         time_generate, time_attack)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (rec["cipher"], rec["mask_p"], rec["mask_u"], rec["n"],
+                     rec["seed"], rec["target_epsilon"],
+                     ",".join(f"{k:#06x}" for k in rec["key"]),
+                     rec["correct_candidate"], rec["correct_rank"], rec["correct_ties"],
+                     rec["time_generate"], rec["time_attack"]),
+                )
+                if cur.rowcount == 0:
+                    continue
+                experiment_id = cur.lastrowid
+                self.conn.executemany(
+                    "INSERT INTO candidates VALUES (?, ?, ?, ?, ?, ?)",
+                    [(experiment_id, candidate, count0, count1, epsilon, diff)
+                     for candidate, (count0, count1, epsilon, diff) in rec["stats"].items()],
+                )
+                added += 1
+        return added
+
+    def candidates(self, experiment_id):
+        """実験 1 件分の候補統計を {候補: (count0, count1, epsilon, diff)} で返す"""
+        rows = self.conn.execute(
+            "SELECT candidate, count0, count1, epsilon, diff FROM candidates "
+            "WHERE experiment_id = ? ORDER BY candidate",
+            (experiment_id,),
+        )
+        return {candidate: tuple(rest) for candidate, *rest in rows}
+
+    def success_rates(self, cipher):
+        """
+        (mask_p, mask_u, n) ごとの実験数・成功率 (正解が 1 位)・平均順位・
+        1 位の成功時に同順位だった候補数の平均を返す。
+        """
+        return self.conn.execute(
+            """
+            SELECT mask_p, mask_u, n,
+                   COUNT(*)                                   AS runs,
+                   AVG(CASE WHEN correct_rank = 1 THEN 1.0 ELSE 0.0 END) AS success,
+                   AVG(correct_rank)                          AS mean_rank,
+                   AVG(CASE WHEN correct_rank = 1 THEN correct_ties END) AS mean_ties_at_top,
+                   AVG(time_attack)                           AS mean_time_attack
+            FROM experiments
+            WHERE cipher = ?
+            GROUP BY mask_p, mask_u, n
+            ORDER BY mask_p, mask_u, n
+            """,
+            (cipher,),
+        ).fetchall()
+
+
+# --- CipherD のスイープ ---
+
+def _check_mask_u(mask_u):
+    """
+    linear_attack_cipherD は k4[15:12] だけを推測するので、mask_u は
+    最上位ニブルに収まっていなければならない (そうでないと全候補が同じカウントになる)。
+    """
+    if _active_nibble(mask_u) != 3:
+        raise ValueError(f"mask_u {mask_u:#06x} must be confined to nibble 3 (k4[15:12])")
+
+
+def run_experiment_cipherD(mask_p, mask_u, n, seed, target_epsilon):
+    """
+    シード seed から秘密鍵と N 個の既知平文を生成し、linear_attack_cipherD を 1 回実行する。
+    同じ引数なら同じ結果になる。
+    """
+    _check_mask_u(mask_u)
+    rng = random.Random(seed)
+    secret_key = tuple(rng.randint(0, 2**16 - 1) for _ in range(5))
+
+    start = time.perf_counter()
+    plaintexts = [rng.randint(0, 2**16 - 1) for _ in range(n)]
+    ciphertexts = [encrypt_cipherD(m, secret_key) for m in plaintexts]
+    time_generate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = linear_attack_cipherD(plaintexts, ciphertexts, mask_p, mask_u, target_epsilon)
+    time_attack = time.perf_counter() - start
+
+    correct_candidate = (secret_key[4] >> 12) & 0xF
+    return {
+        "cipher": "CipherD",
+        "mask_p": mask_p,
+        "mask_u": mask_u,
+        "n": n,
+        "seed": seed,
+        "target_epsilon": target_epsilon,
+        "key": secret_key,
+        "stats": stats,
+        "correct_candidate": correct_candidate,
+        "correct_rank": stats.rank_of(correct_candidate, break_ties=False),
+        "correct_ties": stats.ties_of(correct_candidate),
+        "time_generate": time_generate,
+        "time_attack": time_attack,
+    }
+
+
+def sweep_cipherD(store, masks, Ns, seeds, target_epsilon, batch_size=32):
+    """
+    masks (MASK_P, MASK_U4 の組) × Ns × seeds の全設定のうち、
+    store に未保存のものだけを実行し batch_size 件ごとにまとめて保存する。
+    新しく計算した件数を返す。
+    """
+    for _, mask_u in masks:
+        _check_mask_u(mask_u)
+
+    done = store.completed_configs("CipherD")
+    todo = [
+        (mask_p, mask_u, n, seed)
+        for mask_p, mask_u in masks
+        for n in Ns
+        for seed in seeds
+        if ("CipherD", mask_p, mask_u, n, seed, target_epsilon) not in done
+    ]
+
+    computed = 0
+    batch = []
+    for mask_p, mask_u, n, seed in todo:
+        batch.append(run_experiment_cipherD(mask_p, mask_u, n, seed, target_epsilon))
+        if len(batch) >= batch_size:
+            computed += store.add_many(batch)
+            batch = []
+    if batch:
+        computed += store.add_many(batch)
+    return computed
+
+
+if __name__ == "__main__":
+    masks = [(0x8000, 0x8000)]
+    Ns = [1000, 4000]
+    seeds = range(8)
+    target_epsilon = abs(1/2 - 3/8)
+
+    with ResultStore("results.db") as store:
+        computed = sweep_cipherD(store, masks, Ns, seeds, target_epsilon)
+        print(f"Computed {computed} new experiments.")
+
+        print("MASK_P  MASK_U4      N  runs  success  mean rank  ties@1  attack[s]")
+        for mask_p, mask_u, n, runs, success, mean_rank, ties, t in store.success_rates("CipherD"):
+            ties = f"{ties:6.2f}" if ties is not None else "     -"
+            print(f"{mask_p:#06x}  {mask_u:#06x}  {n:5d}  {runs:4d}  {success:7.2f}  {mean_rank:9.2f}  {ties}  {t:9.4f}")
@@ -0,0 +1,149 @@
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# --- 4ビット S-box の探索 ---
+# 置換 S の 2 つの出力 S[i], S[j] を入れ替える近傍で焼きなましを行い、
+# 最大線形バイアスと差分一様性の小さい S-box を探す。
+# 入れ替えで変わるのは x = i, j の 2 行分だけなので、LAT / DDT は
+# 毎回作り直さずに差分だけ更新する。
+
+# DOT[a, x] = a · x mod 2
+DOT = np.array([[bin(a & x).count("1") % 2 for x in range(16)] for a in range(16)], dtype=np.int8)
+
+# LAT_TERM[x, y][a, b] = 1 if a·x == b·y else 0
+# (入力 x が出力 y に写るときの LAT への寄与)
+LAT_TERM = (DOT.T[:, None, :, None] == DOT.T[None, :, None, :]).astype(np.int16)
+
+
+def lat_table(sbox):
+    """
+    線形近似表 LAT[a, b] = #{x : a·x == b·S[x]} - 8 を返す (バイアス = LAT / 16)。
+    """
+    lat = np.full((16, 16), -8, dtype=np.int16)
+    for x in range(16):
+        lat += LAT_TERM[x, sbox[x]]
+    return lat
+
+
+def ddt_table(sbox):
+    """差分分布表 DDT[dx, dy] = #{x : S[x] ^ S[x ^ dx] == dy} を返す。"""
+    ddt = np.zeros((16, 16), dtype=np.int16)
+    for dx in range(16):
+        for x in range(16):
+            ddt[dx, sbox[x] ^ sbox[x ^ dx]] += 1
+    return ddt
+
+
+def swap_outputs(sbox, lat, ddt, i, j):
+    """
+    sbox[i] と sbox[j] を入れ替え、lat と ddt をその場で差分更新する。
+    同じ (i, j) でもう一度呼ぶと元に戻る。
+    """
+    si, sj = sbox[i], sbox[j]
+    lat += LAT_TERM[i, sj] + LAT_TERM[j, si] - LAT_TERM[i, si] - LAT_TERM[j, sj]
+
+    # DDT は x または x ^ dx が i, j のいずれかである組だけが変わる
+    for dx in range(1, 16):
+        xs = {i, i ^ dx, j, j ^ dx}
+        for x in xs:
+            ddt[dx, sbox[x] ^ sbox[x ^ dx]] -= 1
+    sbox[i], sbox[j] = sj, si
+    for dx in range(1, 16):
+        xs = {i, i ^ dx, j, j ^ dx}
+        for x in xs:
+            ddt[dx, sbox[x] ^ sbox[x ^ dx]] += 1
+
+
+def score(lat, ddt):
+    """
+    順位付け用の評価値 (小さいほど良い):
+      (最大 |LAT|, 差分一様性, 最大 |LAT| を取る要素数, 差分一様性を取る要素数)
+    a = 0 または b = 0 の行・列、dx = 0 の行は除く。
+    """
+    lin = np.abs(lat[1:, 1:])
+    diff = ddt[1:, :]
+    max_lin = int(lin.max())
+    du = int(diff.max())
+    return (max_lin, du, int(np.count_nonzero(lin == max_lin)), int(np.count_nonzero(diff == du)))
+
+
+def _energy(lat, ddt):
+    # 焼きなまし用のコスト。大きい要素ほど強く罰する
+    lin = np.abs(lat[1:, 1:]).astype(np.int64)
+    diff = ddt[1:, :].astype(np.int64)
+    return int((lin ** 3).sum() + (diff ** 3).sum())
+
+
+def anneal(seed, steps=20000, t0=200.0, cooling=0.9995):
+    """
+    ランダムな置換から始めて焼きなましを 1 回行い、途中で見つかった最良の
+    (score, sbox, lat, ddt) を返す。
+    """
+    rng = random.Random(seed)
+    sbox = list(range(16))
+    rng.shuffle(sbox)
+    lat = lat_table(sbox)
+    ddt = ddt_table(sbox)
+    energy = _energy(lat, ddt)
+    best = (score(lat, ddt), sbox[:], lat.copy(), ddt.copy())
+
+    t = t0
+    for _ in range(steps):
+        i, j = rng.sample(range(16), 2)
+        swap_outputs(sbox, lat, ddt, i, j)
+        new_energy = _energy(lat, ddt)
+        if new_energy <= energy or rng.random() < math.exp((energy - new_energy) / t):
+            energy = new_energy
+            current = score(lat, ddt)
+            if current < best[0]:
+                best = (current, sbox[:], lat.copy(), ddt.copy())
+        else:
+            swap_outputs(sbox, lat, ddt, i, j)  # 不採用なので元に戻す
+        t = max(t * cooling, 1e-3)
+    return best
+
+
+def _anneal_args(args):
+    return anneal(*args)
+
+
+def search_sboxes(restarts=8, steps=20000, seed=0, workers=None):
+    """
+    焼きなましを restarts 回 (各プロセスで並列に) 実行し、
+    重複を除いた (score, sbox, lat, ddt) を score の良い順に返す。
+    """
+    jobs = [(seed + r, steps) for r in range(restarts)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_anneal_args, jobs))
+
+    results.sort(key=lambda t: (t[0], t[1]))
+    ranked = []
+    seen = set()
+    for result in results:
+        key = tuple(result[1])
+        if key not in seen:
+            seen.add(key)
+            ranked.append(result)
+    return ranked
+
+
+def to_sbox_dict(sbox):
+    """暗号モジュールの SBOX と同じ {入力: 出力} 形式に変換する"""
+    return {x: y for x, y in enumerate(sbox)}
+
+
+if __name__ == "__main__":
+    ranked = search_sboxes(restarts=8, steps=5000)
+    print("最大バイアス  差分一様性  S-box")
+    for (max_lin, du, n_lin, n_du), sbox, lat, ddt in ranked[:5]:
+        print(f"{max_lin / 16:>10.4f}  {du:>10d}  "
+              + " ".join(f"{y:X}" for y in sbox)
+              + f"   (|LAT|={max_lin}: {n_lin}個, DDT={du}: {n_du}個)")
+
+    _, sbox, lat, ddt = ranked[0]
+    print("\n最良 S-box の LAT (a 行, b 列)")
+    for a in range(16):
+        print(" ".join(f"{v:>3d}" for v in lat[a]))